@@ -10,15 +10,24 @@ Self‑contained utility for inspecting behavioural bouts.
 * All artefacts (PNG + MP4 + HTML) still stored inside `OUTPUT_DIR / EXAMPLES_SUBDIR`.
 * ± 0.5 s buffer on clips, zero‑CLI workflow intact.
 
-Dependencies: `numpy`, `matplotlib`, `tqdm`, `moviepy`, `opencv-python`.
+Dependencies: `numpy`, `matplotlib`, `tqdm`, `moviepy`, `opencv-python`. Clips are
+cut with the ffmpeg binary bundled with moviepy (via `imageio-ffmpeg`).
 """
 from __future__ import annotations
 
-import ast
+import contextlib
+import mmap
+import os
+import re
+import shutil
+import subprocess
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
-import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.figure import Figure
 from tqdm import tqdm
 
 try:
@@ -26,6 +35,13 @@ try:
 except ImportError:
     VideoFileClip = None
 
+try:
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    _BUNDLED_FFMPEG = get_ffmpeg_exe()
+except (ImportError, RuntimeError):  # not installed / no binary available
+    _BUNDLED_FFMPEG = "ffmpeg"
+
 # -----------------------------------------------------------------------------
 # >>>>>>>>>  USER‑CONFIGURABLE CONSTANTS  <<<<<<<<<<<
 # -----------------------------------------------------------------------------
@@ -40,6 +56,19 @@ EXAMPLES_SUBDIR: str = "example_output"  # sub‑folder for artefacts
 BINS: int = 20
 SAMPLES_PER_BEHAVIOUR: int = 5  # 0 = skip sampling
 BUFFER_SEC: float = 0.5  # context on each side of bout
+FFMPEG_BIN: str = _BUNDLED_FFMPEG  # moviepy's binary, else "ffmpeg" on PATH
+REENCODE_CLIPS: bool = False  # True = never stream copy, even H.264 sources
+# Encoders tried in order when the source codec cannot be stream-copied
+# (always 4:2:0 output – browsers cannot decode 4:4:4 H.264)
+CLIP_ENCODERS: tuple[tuple[str, ...], ...] = (
+    # NVIDIA
+    ("-c:v", "h264_nvenc", "-preset", "p4", "-tune", "ll", "-pix_fmt", "yuv420p"),
+    # Intel Quick Sync
+    ("-c:v", "h264_qsv", "-pix_fmt", "nv12"),
+    # CPU
+    ("-c:v", "libx264", "-preset", "veryfast", "-tune", "fastdecode")
+    + ("-pix_fmt", "yuv420p"),
+)
 
 # -----------------------------------------------------------------------------
 # Internals
@@ -48,121 +77,236 @@ BUFFER_SEC: float = 0.5  # context on each side of bout
 EXAMPLES_DIR = OUTPUT_DIR / EXAMPLES_SUBDIR
 IMG_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif"}
 VIDEO_EXTENSIONS = {".mp4", ".webm", ".mov", ".avi"}
+# One `(start, end)` (or `[start, end]`) pair spanning a whole line
+BOUT_RE = re.compile(
+    rb"(?m)^[^\S\n]*[(\[][^\S\n]*(-?\d+)[^\S\n]*,[^\S\n]*(-?\d+)[^\S\n]*[)\]][^\S\n]*$"
+)
+NONBLANK_RE = re.compile(rb"(?m)^[^\S\n]*\S")
+STREAM_COPY: tuple[str, ...] = ("-c", "copy")
+BOUTS_CACHE_VERSION = 1  # bump whenever load_bouts/clean_bouts output changes
+COPYABLE_CODECS = {"h264"}  # the only codec every browser plays from an MP4
+_clip_codec: tuple[str, ...] | None = None  # first codec args that worked
 
 # -----------------------------------------------------------------------------
 # Helper functions
 # -----------------------------------------------------------------------------
 
 
-def parse_tuple(line: str) -> tuple[int, int]:
-    """Parse a `(start, end)` pair of ints from a string line."""
-    tup = ast.literal_eval(line.strip())
-    if (
-        isinstance(tup, (list, tuple))
-        and len(tup) == 2
-        and all(isinstance(x, int) for x in tup)
-    ):
-        return int(tup[0]), int(tup[1])
-    raise ValueError(f"Invalid bout tuple: {line!r}")
-
-
-def load_bouts(txt_path: Path) -> list[tuple[int, int]]:
-    bouts = [parse_tuple(l) for l in txt_path.read_text().splitlines() if l.strip()]
-    bouts.sort(key=lambda t: t[0])
+def load_bouts(txt_path: Path) -> np.ndarray:
+    """Parse `(start, end)` lines into an ``(N, 2)`` int array sorted by start."""
+    if txt_path.stat().st_size == 0:  # mmap cannot map an empty file
+        return np.empty((0, 2), dtype=np.int64)
+    with txt_path.open("rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            flat = np.fromiter(
+                (int(x) for m in BOUT_RE.finditer(mm) for x in m.groups()),
+                dtype=np.int64,
+            )
+            if len(flat) != 2 * sum(1 for _ in NONBLANK_RE.finditer(mm)):
+                # Slow path: split on every newline style (incl. a bare `\r`,
+                # which the regexes do not treat as a line break) line by line
+                lines = [line for line in mm[:].splitlines() if line.strip()]
+                matches = [BOUT_RE.fullmatch(line) for line in lines]
+                for line, m in zip(lines, matches):
+                    if m is None:
+                        bad_line = line.decode(errors="replace")
+                        raise ValueError(
+                            f"Invalid bout tuple in {txt_path.name}: {bad_line!r}"
+                        )
+                flat = np.array(
+                    [int(x) for m in matches for x in m.groups()], dtype=np.int64
+                )
+    arr = flat.reshape(-1, 2)
+    return arr[np.argsort(arr[:, 0], kind="stable")]
+
+
+def clean_bouts(raw_bouts: np.ndarray) -> np.ndarray:
+    """Remove <3‑frame bouts unless a neighbour is <10 frames away and merge.
+
+    A short bout absorbs the bout that follows it, which then cannot absorb its
+    own successor. Within a run of consecutive merge candidates only every
+    other bout (counting from the run start) therefore triggers a merge.
+    """
+    arr = np.asarray(raw_bouts, dtype=np.int64).reshape(-1, 2)
+    n = len(arr)
+    starts, ends = arr[:, 0], arr[:, 1]
+    dur = ends - starts + 1
+
+    merge = np.zeros(n, dtype=bool)
+    merge[:-1] = (dur[:-1] < 3) & (starts[1:] - ends[:-1] < 10)
+
+    idx = np.arange(n)
+    run_start = merge & ~np.concatenate(([False], merge[:-1]))
+    first = np.maximum.accumulate(np.where(run_start, idx, 0))
+    active = merge & ((idx - first) % 2 == 0)
+    absorbed = np.concatenate(([False], active[:-1]))
+
+    keep = ~absorbed & (active | (dur >= 3))
+    merged_end = np.where(active, np.roll(ends, -1), ends)
+    return np.stack([starts[keep], merged_end[keep]], axis=1)
+
+
+def load_clean_bouts(txt_path: Path) -> np.ndarray:
+    """`clean_bouts(load_bouts(...))`, cached in a `.bouts.v<N>.npy` sidecar."""
+    cache = txt_path.with_suffix(f".bouts.v{BOUTS_CACHE_VERSION}.npy")
+    if cache.exists() and cache.stat().st_mtime >= txt_path.stat().st_mtime:
+        try:
+            return np.load(cache)
+        except (ValueError, OSError, EOFError):  # truncated/corrupt: rebuild
+            pass
+    bouts = clean_bouts(load_bouts(txt_path))
+    # Write beside the target and rename, so a killed worker or full disk never
+    # leaves a truncated sidecar behind
+    tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+    try:
+        with tmp.open("wb") as f:
+            np.save(f, bouts)
+        os.replace(tmp, cache)
+    except OSError:  # read-only / shared / full DATA_DIR – just run uncached
+        with contextlib.suppress(OSError):
+            tmp.unlink(missing_ok=True)
     return bouts
 
 
-def clean_bouts(raw_bouts: list[tuple[int, int]]) -> list[tuple[int, int]]:
-    """Remove <3‑frame bouts unless a neighbour is <10 frames away and merge."""
-    cleaned: list[tuple[int, int]] = []
-    i = 0
-    while i < len(raw_bouts):
-        start, end = raw_bouts[i]
-        dur = end - start + 1
-        if dur < 3 and i + 1 < len(raw_bouts):
-            nxt_start, nxt_end = raw_bouts[i + 1]
-            if nxt_start - end < 10:
-                cleaned.append((start, nxt_end))
-                i += 2
-                continue
-            i += 1  # drop
-            continue
-        if dur >= 3:
-            cleaned.append((start, end))
-        i += 1
-    return cleaned
-
-
-def save_histogram(bouts: list[tuple[int, int]], behaviour: str) -> str:
+def save_histogram(bouts: np.ndarray, behaviour: str) -> str:
     """Plot histogram, save PNG, return filename (relative)."""
-    durations = [e - s + 1 for s, e in bouts]
-    plt.figure()
-    plt.hist(durations, bins=BINS)
-    plt.title(f"{behaviour} bout durations (frames)")
-    plt.xlabel("Duration (frames)")
-    plt.ylabel("Count")
+    arr = np.asarray(bouts, dtype=np.int64).reshape(-1, 2)
+    durations = arr[:, 1] - arr[:, 0] + 1
+    fig = Figure()
+    ax = fig.subplots()
+    if durations.size:
+        lo, hi = int(durations.min()), int(durations.max())
+        nbins = min(BINS, hi - lo + 1)  # never split a single frame count
+        edges = np.linspace(lo, hi + 1, nbins + 1)
+        counts, _ = np.histogram(durations, bins=edges)
+        ax.bar(
+            edges[:-1], counts, width=np.diff(edges), align="edge", edgecolor="black"
+        )
+    ax.set_title(f"{behaviour} bout durations (frames)")
+    ax.set_xlabel("Duration (frames)")
+    ax.set_ylabel("Count")
     out = EXAMPLES_DIR / f"{behaviour}_histogram.png"
-    plt.savefig(out, dpi=300, bbox_inches="tight")
-    plt.close()
+    fig.savefig(out, dpi=150, bbox_inches="tight")
     return out.name
 
 
+def has_video_stream(path: Path) -> bool:
+    """True if ffmpeg finds a video stream in `path` (exit 0 ≠ non-empty clip)."""
+    if not path.exists():
+        return False
+    proc = subprocess.run(
+        [FFMPEG_BIN, "-hide_banner", "-i", str(path)],  # no output: probe only
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        errors="replace",
+    )
+    return re.search(r"Stream #\S+.*: Video:", proc.stderr) is not None
+
+
+def cut_clip(video: Path, s_t: float, e_t: float, out: Path, stream_copy: bool) -> None:
+    """Write `video[s_t:e_t]` to `out`, via stream copy or CLIP_ENCODERS."""
+    global _clip_codec
+    candidates = list(CLIP_ENCODERS)
+    if stream_copy:
+        candidates.insert(0, STREAM_COPY)
+    if _clip_codec in candidates:
+        candidates.remove(_clip_codec)
+        candidates.insert(0, _clip_codec)
+
+    head = [FFMPEG_BIN, "-y", "-hide_banner", "-loglevel", "error"]
+    if round(s_t, 3) > 0:  # `-ss 0` can fail to seek on copy -> empty MP4
+        head += ["-ss", f"{s_t:.3f}"]
+    head += ["-to", f"{e_t:.3f}", "-i", str(video), "-an"]
+    stderr = ""
+    for codec in candidates:
+        proc = subprocess.run(
+            [*head, *codec, "-movflags", "+faststart", str(out)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            errors="replace",
+        )
+        if proc.returncode == 0 and has_video_stream(out):
+            _clip_codec = codec
+            return
+        stderr = proc.stderr or f"{out.name} was written without a video stream"
+    tail = "\n".join(stderr.strip().splitlines()[-5:])
+    raise RuntimeError(
+        f"ffmpeg could not export {out.name} with any codec; last error:\n{tail}"
+    )
+
+
 def extract_sample_clips(
-    video: Path, bouts: list[tuple[int, int]], behaviour: str, fps: float
+    video: Path,
+    bouts: np.ndarray,
+    behaviour: str,
+    fps: float,
+    video_dur: float,
+    stream_copy: bool,
 ) -> list[str]:
+    """Cut ±BUFFER_SEC clips around the first bouts (see `cut_clip`)."""
     if SAMPLES_PER_BEHAVIOUR <= 0:
         return []
-    if VideoFileClip is None:
-        raise RuntimeError("`moviepy` missing – `pip install moviepy` to export clips.")
+    if shutil.which(FFMPEG_BIN) is None:
+        raise RuntimeError(
+            f"`{FFMPEG_BIN}` not found – `pip install imageio-ffmpeg` to cut clips."
+        )
 
-    master = VideoFileClip(str(video))
-    video_dur = master.duration
     saved: list[str] = []
-    use_subclipped = hasattr(master, "subclipped") and not hasattr(master, "subclip")
-
     for idx, (s_f, e_f) in enumerate(bouts[:SAMPLES_PER_BEHAVIOUR]):
         s_t = max(0.0, s_f / fps - BUFFER_SEC)
         e_t = min(video_dur, e_f / fps + BUFFER_SEC)
-        sub = (
-            master.subclipped(s_t, e_t) if use_subclipped else master.subclip(s_t, e_t)
-        )
         out = EXAMPLES_DIR / f"{behaviour}_{idx}.mp4"
-        sub.write_videofile(
-            str(out), codec="libx264", audio=False, logger=None, preset="ultrafast"
-        )
+        cut_clip(video, s_t, e_t, out, stream_copy)
         saved.append(out.name)
-    master.close()
     return saved
 
 
 def write_html_gallery(behaviour_assets: dict[str, list[str]]):
     html = EXAMPLES_DIR / "gallery.html"
-    with html.open("w", encoding="utf-8") as f:
-        f.write("<html><head><title>Behaviour Gallery</title></head><body>\n")
-        f.write("<h1>Behaviour Histograms & Sample Clips</h1>\n")
-        for behaviour, assets in behaviour_assets.items():
-            if not assets:
-                continue
-            f.write(
-                f"<h2>{behaviour}</h2>\n<div style='display:flex;flex-wrap:wrap;gap:20px'>\n"
-            )
-            for asset in assets:
-                ext = Path(asset).suffix.lower()
-                if ext in IMG_EXTENSIONS:
-                    f.write(
-                        f"<img src='{asset}' style='max-width:400px;margin-bottom:10px;'>\n"
-                    )
-                elif ext in VIDEO_EXTENSIONS:
-                    f.write(
-                        f"<video width='320' controls style='margin-bottom:10px;'>\n"
-                        f"  <source src='{asset}' type='video/mp4'>\n"
-                        f"</video>\n"
-                    )
-            f.write("</div>\n")
-        f.write("</body></html>")
+    parts: list[str] = [
+        "<html><head><title>Behaviour Gallery</title></head><body>",
+        "<h1>Behaviour Histograms & Sample Clips</h1>",
+    ]
+    for behaviour, assets in behaviour_assets.items():
+        if not assets:
+            continue
+        parts.append(f"<h2>{behaviour}</h2>")
+        parts.append("<div style='display:flex;flex-wrap:wrap;gap:20px'>")
+        for asset in assets:
+            ext = Path(asset).suffix.lower()
+            if ext in IMG_EXTENSIONS:
+                parts.append(
+                    f"<img src='{asset}' loading='lazy' "
+                    "style='max-width:400px;margin-bottom:10px;'>"
+                )
+            elif ext in VIDEO_EXTENSIONS:
+                parts.append(
+                    "<video preload='none' width='320' controls "
+                    "style='margin-bottom:10px;'>\n"
+                    f"  <source src='{asset}' type='video/mp4'>\n"
+                    "</video>"
+                )
+        parts.append("</div>")
+    parts.append("</body></html>")
+    html.write_text("\n".join(parts), encoding="utf-8")
     return html
 
 
+def process_behaviour(
+    txt: Path, fps: float, video_dur: float, stream_copy: bool
+) -> tuple[str, list[str]]:
+    """Histogram + sample clips for one behaviour file; runs in a worker."""
+    behaviour = txt.stem
+    bouts = load_clean_bouts(txt)
+    assets = [save_histogram(bouts, behaviour)]
+    assets.extend(
+        extract_sample_clips(VIDEO_PATH, bouts, behaviour, fps, video_dur, stream_copy)
+    )
+    return behaviour, assets
+
+
 # -----------------------------------------------------------------------------
 # Main
 # -----------------------------------------------------------------------------
@@ -181,23 +325,25 @@ def main():
 
     if VideoFileClip is None:
         raise RuntimeError("moviepy required – `pip install moviepy`.")
-    tmp = VideoFileClip(str(VIDEO_PATH))
-    fps = tmp.fps
-    tmp.close()
+    # Single probe; workers get fps/duration and cut clips with ffmpeg directly
+    with VideoFileClip(str(VIDEO_PATH)) as master:
+        fps, video_dur = master.fps, master.duration
+        codec = getattr(master.reader, "infos", {}).get("video_codec_name")
+    # A zero ffmpeg exit does not mean the copy plays in a browser (MJPEG in MP4
+    # does not), so only copy codecs known to work; unknown codec = re-encode.
+    stream_copy = not REENCODE_CLIPS and codec in COPYABLE_CODECS
 
     behaviour_assets: dict[str, list[str]] = defaultdict(list)
 
-    for txt in txt_files:
-        behaviour = txt.stem
-        bouts = clean_bouts(load_bouts(txt))
-
-        # Histogram PNG
-        hist_png = save_histogram(bouts, behaviour)
-        behaviour_assets[behaviour].append(hist_png)
-
-        # Video clips
-        clips = extract_sample_clips(VIDEO_PATH, bouts, behaviour, fps)
-        behaviour_assets[behaviour].extend(clips)
+    worker = partial(
+        process_behaviour, fps=fps, video_dur=video_dur, stream_copy=stream_copy
+    )
+    n_workers = min(len(txt_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        for behaviour, assets in tqdm(
+            pool.map(worker, txt_files), total=len(txt_files), desc="Behaviours"
+        ):
+            behaviour_assets[behaviour].extend(assets)
 
     gallery = write_html_gallery(behaviour_assets)
     print("Gallery saved to:", gallery)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import behavior_analysis as ba
+
+
+def reference_clean_bouts(raw_bouts):
+    """The original per-bout loop that `clean_bouts` vectorises."""
+    cleaned = []
+    i = 0
+    while i < len(raw_bouts):
+        start, end = raw_bouts[i]
+        dur = end - start + 1
+        if dur < 3 and i + 1 < len(raw_bouts):
+            nxt_start, nxt_end = raw_bouts[i + 1]
+            if nxt_start - end < 10:
+                cleaned.append((start, nxt_end))
+                i += 2
+                continue
+            i += 1
+            continue
+        if dur >= 3:
+            cleaned.append((start, end))
+        i += 1
+    return cleaned
+
+
+def as_pairs(arr):
+    return [tuple(int(x) for x in row) for row in arr]
+
+
+@pytest.mark.parametrize(
+    "raw",
+    [
+        [],
+        [(5, 5)],
+        [(5, 20)],
+        [(0, 1), (4, 20)],  # short bout merges into its neighbour
+        [(0, 0), (3, 3), (6, 6), (9, 9), (12, 30)],  # chained merge candidates
+        [(0, 1), (3, 4), (6, 20), (40, 41), (43, 44)],  # odd and even runs
+        [(0, 1), (30, 50)],  # gap too large: short bout dropped
+        [(0, 20), (25, 26)],  # trailing short bout dropped
+        [(0, 20), (22, 22), (50, 51)],
+    ],
+)
+def test_clean_bouts_matches_reference_loop(raw):
+    arr = np.array(raw, dtype=np.int64).reshape(-1, 2)
+    out = ba.clean_bouts(arr)
+    assert out.shape[1] == 2
+    assert as_pairs(out) == reference_clean_bouts(raw)
+
+
+def test_clean_bouts_matches_reference_loop_random():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        n = int(rng.integers(0, 12))
+        starts = np.sort(rng.integers(0, 100, n))
+        ends = starts + rng.integers(-1, 6, n)
+        raw = [(int(s), int(e)) for s, e in zip(starts, ends)]
+        out = ba.clean_bouts(np.array(raw, dtype=np.int64).reshape(-1, 2))
+        assert as_pairs(out) == reference_clean_bouts(raw)
+
+
+def test_load_bouts_sorts_by_start(tmp_path):
+    txt = tmp_path / "b.txt"
+    txt.write_text("(10, 20)\n\n( -1 , 5 )\n[3, 9]\n")
+    assert as_pairs(ba.load_bouts(txt)) == [(-1, 5), (3, 9), (10, 20)]
+
+
+@pytest.mark.parametrize("text", ["", "\n\n"])
+def test_load_bouts_empty(tmp_path, text):
+    txt = tmp_path / "b.txt"
+    txt.write_text(text)
+    assert ba.load_bouts(txt).shape == (0, 2)
+
+
+@pytest.mark.parametrize("bad", ["(2.5, 7)", "(1, 5) x", "(1, 5)(6, 8)"])
+def test_load_bouts_rejects_malformed_line(tmp_path, bad):
+    txt = tmp_path / "b.txt"
+    txt.write_text(f"(1, 5)\n{bad}\n[3, 9]\n")
+    with pytest.raises(ValueError, match="Invalid bout tuple"):
+        ba.load_bouts(txt)
+
+
+def test_load_bouts_accepts_bare_cr_line_endings(tmp_path):
+    txt = tmp_path / "b.txt"
+    txt.write_bytes(b"(3,4)\r(1,2)\n")
+    assert as_pairs(ba.load_bouts(txt)) == [(1, 2), (3, 4)]
+
+
+def test_load_clean_bouts_rebuilds_truncated_cache(tmp_path):
+    txt = tmp_path / "b.txt"
+    txt.write_text("(0, 1)\n(4, 20)\n(30, 40)\n")
+    expected = as_pairs(ba.load_clean_bouts(txt))
+    (cache,) = tmp_path.glob("*.npy")
+    cache.write_bytes(cache.read_bytes()[:20])  # e.g. worker killed mid-write
+    assert as_pairs(ba.load_clean_bouts(txt)) == expected
+    assert as_pairs(np.load(cache)) == expected
+    assert not list(tmp_path.glob("*.tmp"))